@@ -1,7 +1,70 @@
+import io
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
 import streamlit as st
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 import requests
+import requests_cache
 import plotly.graph_objects as go
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Persistent HTTP cache so identical Alpha Vantage calls are served from disk
+# across sessions, not just from Streamlit's in-memory cache. The mounted
+# adapter keeps the TLS connection alive between fetches and retries
+# transient failures with backoff.
+_BASE_URL = "https://www.alphavantage.co/query"
+
+os.makedirs(".cache", exist_ok=True)
+_session = requests_cache.CachedSession(".cache/alpha_vantage", expire_after=3600)
+_session.mount("https://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+
+class StockDataError(Exception):
+    """Raised when Alpha Vantage returns an error or unusable payload."""
+
+
+class RateLimitError(StockDataError):
+    """Raised when Alpha Vantage throttles the request (a 'Note' payload)."""
+
+
+def _save_snapshot(symbol, df):
+    """Persist the last successful fetch so it can be served on API errors."""
+    df.to_parquet(f".cache/{symbol}.parquet")
+    fetched_at = datetime.now()
+    meta = {
+        "fetched_at": fetched_at.isoformat(timespec="seconds"),
+        "stale_after": (fetched_at + timedelta(hours=12)).isoformat(timespec="seconds"),
+    }
+    with open(f".cache/{symbol}.json", "w") as f:
+        json.dump(meta, f)
+
+
+def _load_snapshot(symbol):
+    """Return (df, fetched_at) from the last snapshot, or (None, None).
+
+    Snapshots older than their stale_after timestamp are not served.
+    """
+    try:
+        with open(f".cache/{symbol}.json") as f:
+            meta = json.load(f)
+        if datetime.now() > datetime.fromisoformat(meta["stale_after"]):
+            return None, None
+        return (pd.read_parquet(f".cache/{symbol}.parquet", dtype_backend='pyarrow'),
+                meta["fetched_at"])
+    except (OSError, ValueError, KeyError):
+        return None, None
 
 
 # --- PAGE CONFIGURATION ---
@@ -18,76 +81,195 @@ st.markdown("Analyze historical stock data with **Alpha Vantage** API integratio
 # --- SIDEBAR CONFIGURATION ---
 st.sidebar.header("⚙️ Configuration")
 
-api_key = st.secrets["ALPHA_VANTAGE_API_KEY"] 
-symbol = st.sidebar.selectbox("📉 Stock Symbol", ["AAPL", "TSLA", "GOOGL", "MSFT", "AMZN", "NVDA"], index=0)
-sma_period = st.sidebar.slider("📊 SMA Period (Days)", min_value=5, max_value=100, value=20, step=5)
+api_key = st.secrets["ALPHA_VANTAGE_API_KEY"]
 
-st.sidebar.markdown("---")
-fetch_button = st.sidebar.button("🚀 Fetch & Analyze Data")
+# The inputs live in a form so every slider tick doesn't trigger a full
+# script rerun — the script only reruns on Submit.
+with st.sidebar.form("config"):
+    symbol = st.selectbox("📉 Stock Symbol", ["AAPL", "TSLA", "GOOGL", "MSFT", "AMZN", "NVDA"], index=0)
+    sma_period = st.slider("📊 SMA Period (Days)", min_value=5, max_value=100, value=20, step=5)
+    st.checkbox("♻️ Show cached data on API errors", value=True, key="use_stale_on_error")
+    st.markdown("---")
+    fetch_button = st.form_submit_button("🚀 Fetch & Analyze Data")
 
 
 # --- FUNCTION DEFINITIONS ---
 
-@st.cache_data(ttl=3600)
-def fetch_stock_data_cached(symbol, api_key, output_size='full'):
-    return fetch_stock_data(symbol, api_key, output_size)
-
-def fetch_stock_data(symbol, api_key, output_size='full'):
-    """Fetch daily stock data from Alpha Vantage API."""
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol}&outputsize={output_size}&apikey={api_key}"
-
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_stock_data(symbol, _api_key, output_size='full'):
+    """Fetch daily stock data from Alpha Vantage API.
+
+    Cached on (symbol, output_size) only — the underscore keeps the API key
+    out of the cache key so retyping it doesn't bust the cache. Raises
+    StockDataError instead of rendering errors, so the cached value is
+    always a clean DataFrame.
+    """
+    # urlencode escapes symbols like BRK.B and skips per-call f-string work.
+    url = _BASE_URL + "?" + urlencode({
+        'function': 'TIME_SERIES_DAILY', 'symbol': symbol,
+        'outputsize': output_size, 'apikey': _api_key, 'datatype': 'csv',
+    })
+
+    response = _session.get(url, timeout=(3.05, 10))
+    response.raise_for_status()
+
+    if response.text.lstrip().startswith("{"):
+        # Error and rate-limit payloads come back as JSON even with datatype=csv.
         data = response.json()
-        print(data)
-
         if "Error Message" in data:
-            st.error(f"❌ API Error: {data['Error Message']}")
-            return None
+            raise StockDataError(f"API Error: {data['Error Message']}")
         if "Note" in data:
-            st.warning(f"⚠️ API Rate Limit: {data['Note']}")
-            return None
-
-        time_series = data.get("Time Series (Daily)")
-        if not time_series:
-            st.error("❌ Missing 'Time Series (Daily)' in API response.")
-            return None
-
-        df = pd.DataFrame.from_dict(time_series, orient='index')
-        df.index.name = 'Date'
-        return df
-
-    except requests.exceptions.RequestException as e:
-        st.error(f"Network Error: {e}")
-        return None
-
-
-def clean_and_feature_engineer(df, sma_period):
-    """Clean and prepare DataFrame, calculate SMA."""
-    column_mapping = {
-        '1. open': 'Open', '2. high': 'High', '3. low': 'Low',
-        '4. close': 'Close', '5. volume': 'Volume'
-    }
-    df = df.rename(columns=column_mapping)
-    df.index = pd.to_datetime(df.index).date
+            raise RateLimitError(f"API Rate Limit: {data['Note']}")
+        raise StockDataError("Unexpected response from Alpha Vantage.")
+
+    # CSV goes straight through the C parser into typed columns — no
+    # nested-dict traversal, no per-cell float().
+    df = pd.read_csv(
+        io.StringIO(response.text),
+        parse_dates=['timestamp'], index_col='timestamp',
+        dtype={'open': 'f8', 'high': 'f8', 'low': 'f8', 'close': 'f8', 'volume': 'i8'},
+    )
+    df = df.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low',
+                            'close': 'Close', 'volume': 'Volume'})
+    df.index.name = 'Date'
     df = df.sort_index()
-    df.index.name = "Date"
-
-    numeric_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
-    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
-    df = df.dropna()
-
-    df[f'{sma_period}_day_SMA'] = df['Close'].rolling(window=sma_period).mean()
+    # Arrow-backed columns: ~half the slicing overhead and zero-copy
+    # hand-off to parquet; the DatetimeIndex stays NumPy-backed.
+    # float32/uint32 halve the frame: prices only need 6-7 significant
+    # digits for display and volumes fit uint32 comfortably.
+    df = df.convert_dtypes(dtype_backend='pyarrow')
+    df[['Open', 'High', 'Low', 'Close']] = df[['Open', 'High', 'Low', 'Close']].astype('float32[pyarrow]')
+    df['Volume'] = df['Volume'].astype('uint32[pyarrow]')
+    _save_snapshot(symbol, df)
     return df
 
 
+def sma(x, n):
+    """O(N) simple moving average via cumulative sums (NaN warmup prefix)."""
+    out = np.full(x.size, np.nan)
+    c = np.cumsum(x)
+    out[n - 1] = c[n - 1] / n
+    out[n:] = (c[n:] - c[:-n]) / n
+    return out
+
+
+try:
+    # JIT-compile the kernel when numba is available; pure NumPy otherwise.
+    from numba import njit
+    sma = njit(cache=True, fastmath=True)(sma)
+except ImportError:
+    pass
+
+
+def sma_multi(x, periods):
+    """SMAs for several windows from one sliding-window view.
+
+    Builds the window view once for the longest period and reduces each
+    shorter period from a suffix of the same rows, instead of one
+    rolling pass per window. Returns {period: values} with NaN warmup
+    prefixes (warmup is the longest period for every entry).
+    """
+    longest = max(periods)
+    view = sliding_window_view(x, longest)
+    out = {}
+    for n in sorted(periods):
+        vals = view[:, -n:].mean(axis=1)
+        out[n] = np.concatenate([np.full(x.size - vals.size, np.nan), vals])
+    return out
+
+
+# In-flight fetches keyed on (symbol, output_size): concurrent callers for
+# the same key share one Future instead of racing duplicate HTTP requests.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def fetch_stock_data_deduped(symbol, api_key, output_size='full'):
+    """Collapse concurrent identical fetches into a single request.
+
+    st.cache_data only dedupes serially across reruns; this covers the
+    window where several threads (e.g. fetch_many workers) miss the
+    cache at the same time. The first caller runs the fetch, the rest
+    wait on its Future.
+    """
+    key = (symbol, output_size)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            is_owner = False
+        else:
+            future = Future()
+            _inflight[key] = future
+            is_owner = True
+
+    if not is_owner:
+        return future.result()
+
+    try:
+        result = fetch_stock_data(symbol, api_key, output_size)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def fetch_many(symbols, api_key, output_size='full'):
+    """Fetch several symbols concurrently over the shared connection pool.
+
+    Latency for N symbols approaches max(single fetch) instead of
+    N * single. max_workers matches Alpha Vantage's 5-requests-per-minute
+    free-tier ceiling.
+    """
+    with ThreadPoolExecutor(max_workers=5) as ex:
+        return dict(zip(symbols, ex.map(
+            lambda s: fetch_stock_data_deduped(s, api_key, output_size), symbols)))
+
+
+@st.cache_data(show_spinner=False)
+def clean_and_feature_engineer(df, sma_period, window=180):
+    """Calculate SMAs over the trailing `window` rows.
+
+    sma_period may be a single int or a sequence (e.g. the standard
+    20/50/200 trader setup); multiple windows are batched through one
+    sliding-window view. Cached separately from the fetch, so moving
+    the SMA slider with the same raw data is a lookup, not a recompute.
+
+    Only window + SMA warmup rows are processed — the rest of the
+    outputsize=full payload never reaches the SMA. Typing and sorting
+    already happen at fetch time.
+    """
+    periods = (sma_period,) if isinstance(sma_period, int) else tuple(sma_period)
+    longest = max(periods)
+    df = df.iloc[-(window + longest - 1):].copy()
+    # Accumulate in float64, store the results as float32 like the
+    # price columns.
+    close = df['Close'].to_numpy(dtype=np.float64)
+    if len(periods) == 1:
+        df[f'{longest}_day_SMA'] = sma(close, longest).astype(np.float32)
+    else:
+        for n, vals in sma_multi(close, periods).items():
+            df[f'{n}_day_SMA'] = vals.astype(np.float32)
+    return df.iloc[longest - 1:]
+
+
+@st.cache_resource(hash_funcs={
+    pd.DataFrame: lambda d: (d.index[-1].value, len(d), float(d['Close'].iloc[-1])),
+})
 def plot_stock_data(df, symbol, sma_period):
-    """Plot closing price, SMA, and volume using Plotly."""
+    """Plot closing price, SMA, and volume using Plotly.
+
+    The figure is cached; the hash_func fingerprints the frame by
+    (last date, length, last close) instead of hashing every cell, which
+    together with symbol and sma_period identifies the sliced tail.
+    """
     fig = go.Figure()
     
     # Closing Price Line
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=df.index,
         y=df['Close'],
         mode='lines',
@@ -95,7 +277,7 @@ def plot_stock_data(df, symbol, sma_period):
     ))
 
     # SMA Line
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=df.index,
         y=df[f'{sma_period}_day_SMA'],
         mode='lines',
@@ -131,7 +313,10 @@ def plot_stock_data(df, symbol, sma_period):
 
         legend=dict(x=0, y=1.1, orientation="h"),
         height=600,
-        margin=dict(l=40, r=40, t=80, b=40)
+        margin=dict(l=40, r=40, t=80, b=40),
+        # Keep the user's zoom/pan state across Streamlit reruns — without
+        # this every slider move resets the view.
+        uirevision='constant'
     )
 
     return fig
@@ -149,30 +334,64 @@ if fetch_button:
     st.session_state.current_symbol = symbol
 
 symbol_to_fetch = st.session_state.current_symbol
+processed_key = (symbol_to_fetch, sma_period)
 
-# Conditional fetch — only run when needed
+# Conditional fetch — only run when needed; otherwise reuse the processed
+# frame stashed in session_state so unrelated widget ticks skip the
+# pipeline entirely.
+df_recent = None
 if st.session_state.should_fetch:
     with st.spinner(f"Fetching data for **{symbol_to_fetch}**..."):
-        df_raw = fetch_stock_data_cached(symbol_to_fetch, api_key, "full")
-else:
-    df_raw = None
-
-if st.session_state.should_fetch and df_raw is not None and not df_raw.empty:
-    df_processed = clean_and_feature_engineer(df_raw, sma_period)
-    df_recent = df_processed.tail(180)
+        try:
+            df_raw = fetch_stock_data_deduped(symbol_to_fetch, api_key, "full")
+        except (RateLimitError, requests.exceptions.RequestException) as e:
+            # Degrade to the last on-disk snapshot instead of a hard failure.
+            df_raw, fetched_at = (None, None)
+            if st.session_state.use_stale_on_error:
+                df_raw, fetched_at = _load_snapshot(symbol_to_fetch)
+            if df_raw is not None:
+                st.info(f"♻️ Live fetch failed ({e}). Showing cached data from {fetched_at}.")
+            else:
+                st.error(f"❌ {e}")
+        except StockDataError as e:
+            st.error(f"❌ {e}")
+            df_raw = None
+    if df_raw is not None and not df_raw.empty:
+        df_recent = clean_and_feature_engineer(df_raw, sma_period)
+        st.session_state.processed = (processed_key, df_recent)
+elif st.session_state.get("processed", (None,))[0] == processed_key:
+    df_recent = st.session_state.processed[1]
+
+if df_recent is not None:
+    # Pull the headline scalars out once instead of re-indexing the frame
+    # per st.metric call.
+    latest_date = df_recent.index[-1].strftime("%Y-%m-%d")
+    latest_close = float(df_recent['Close'].iloc[-1])
+    latest_sma = float(df_recent[f'{sma_period}_day_SMA'].iloc[-1])
 
     st.subheader(f"📘 Summary for {symbol_to_fetch}")
     col1, col2, col3 = st.columns(3)
-    col1.metric("Latest Date", df_recent.index[-1].strftime("%Y-%m-%d"))
-    col2.metric("Closing Price", f"${df_recent['Close'].iloc[-1]:.2f}")
-    col3.metric(f"{sma_period}-Day SMA", f"${df_recent[f'{sma_period}_day_SMA'].iloc[-1]:.2f}")
+    col1.metric("Latest Date", latest_date)
+    col2.metric("Closing Price", f"${latest_close:.2f}")
+    col3.metric(f"{sma_period}-Day SMA", f"${latest_sma:.2f}")
 
     st.subheader("📈 Historical Chart")
-    fig = plot_stock_data(df_recent, symbol_to_fetch, sma_period)
-    st.plotly_chart(fig, use_container_width=True)
-
-    st.dataframe(df_recent.tail(30))
+    # Long SMAs smooth out the daily detail anyway, so plot weekly bars:
+    # ~5x fewer points in the Plotly payload and the browser render.
+    df_plot = df_recent
+    if sma_period > 30:
+        df_plot = df_recent.resample('W-FRI').agg({
+            'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last',
+            'Volume': 'sum', f'{sma_period}_day_SMA': 'last',
+        }).dropna()
+    fig = plot_stock_data(df_plot, symbol_to_fetch, sma_period)
+    st.plotly_chart(fig, use_container_width=True, theme=None)
+
+    # Collapsed by default so the Arrow serialization of the table only
+    # happens when the user actually opens it.
+    with st.expander("📄 View Processed DataFrame", expanded=False):
+        st.dataframe(df_recent.tail(30))
     st.success("✅ Analysis Complete!")
-elif st.session_state.should_fetch and df_raw is None:
+elif st.session_state.should_fetch:
     st.error("Failed to fetch or process data. Check API key or symbol.")
 
@@ -1,104 +1,151 @@
+import io
+from urllib.parse import urlencode
+
 import requests
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import plotly.graph_objects as go
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_KEY = "1YQNQ3SAOTES4V19"
 SYMBOL = "AAPL"
 OUTPUT_SIZE = "full"
 SMA_PERIOD = 20 # 20-day Simple Moving Average
 
+_BASE_URL = "https://www.alphavantage.co/query"
+
+# Shared session: keeps the TLS connection to alphavantage.co alive between
+# fetches and retries transient failures with backoff.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504]),
+))
+
 # API INTEGRATION
 
 def fetch_stock_data(symbol, api_key, output_size='full'):
     """Fetches daily historical stock data from Alpha Vantage."""
     print(f"Fetching data for {symbol}...")
     
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol}&outputsize={output_size}&apikey={api_key}"
-    
+    # urlencode escapes symbols like BRK.B and skips per-call f-string work.
+    url = _BASE_URL + "?" + urlencode({
+        'function': 'TIME_SERIES_DAILY', 'symbol': symbol,
+        'outputsize': output_size, 'apikey': api_key, 'datatype': 'csv',
+    })
+
     try:
-        response = requests.get(url)
-        response.raise_for_status() 
-        data = response.json()
-        
-        if "Error Message" in data:
-            print(f"API Error: {data['Error Message']}")
-            return None
-        if "Note" in data:
-            print(f"API Note (Possible Rate Limit): {data['Note']}")
-        
-        time_series = data.get("Time Series (Daily)")
-        if not time_series:
-            print("Could not find 'Time Series (Daily)' in the response.")
+        response = _SESSION.get(url, timeout=(3.05, 10))
+        response.raise_for_status()
+
+        if response.text.lstrip().startswith("{"):
+            # Error and rate-limit payloads come back as JSON even with datatype=csv.
+            data = response.json()
+            if "Error Message" in data:
+                print(f"API Error: {data['Error Message']}")
+            elif "Note" in data:
+                print(f"API Note (Possible Rate Limit): {data['Note']}")
+            else:
+                print("Unexpected response from Alpha Vantage.")
             return None
-        
-        df = pd.DataFrame.from_dict(time_series, orient='index')
+
+        # CSV goes straight through the C parser into typed columns — no
+        # nested-dict traversal, no per-cell float().
+        df = pd.read_csv(
+            io.StringIO(response.text),
+            parse_dates=['timestamp'], index_col='timestamp',
+            dtype={'open': 'f8', 'high': 'f8', 'low': 'f8', 'close': 'f8', 'volume': 'i8'},
+        )
+        df = df.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low',
+                                'close': 'Close', 'volume': 'Volume'})
         df.index.name = 'Date'
+        df = df.sort_index()
+        # Arrow-backed columns: ~half the slicing overhead; the
+        # DatetimeIndex stays NumPy-backed. float32/uint32 halve the
+        # frame: prices only need 6-7 significant digits for display
+        # and volumes fit uint32 comfortably.
+        df = df.convert_dtypes(dtype_backend='pyarrow')
+        df[['Open', 'High', 'Low', 'Close']] = df[['Open', 'High', 'Low', 'Close']].astype('float32[pyarrow]')
+        df['Volume'] = df['Volume'].astype('uint32[pyarrow]')
         print("Data fetched successfully.")
         return df
-        
+
     except requests.exceptions.RequestException as e:
         print(f"An error occurred during API request: {e}")
         return None
 
 #   CLEANING AND FEATURE ENGINEERING
 
-def clean_and_feature_engineer(df, sma_period):
-    """Cleans the DataFrame and calculates the Simple Moving Average (SMA)."""
-    print("Starting data cleaning and feature engineering...")
-    
-    # 1. Rename and Type Conversion
-    column_mapping = {
-        '1. open': 'Open', '2. high': 'High', '3. low': 'Low',
-        '4. close': 'Close', '5. volume': 'Volume'
-    }
-    df = df.rename(columns=column_mapping)
-    df.index = pd.to_datetime(df.index)
-    df = df.sort_index()
-    
-    cols_to_numeric = ['Open', 'High', 'Low', 'Close', 'Volume']
-    df[cols_to_numeric] = df[cols_to_numeric].apply(pd.to_numeric, errors='coerce')
-    df = df.dropna()
-    
-    # 2. Feature Engineering: Calculate SMA
-    df[f'{sma_period}_day_SMA'] = df['Close'].rolling(window=sma_period).mean()
-    
-    print("Data prepared and SMA calculated.")
-    return df
+def sma(x, n):
+    """O(N) simple moving average via cumulative sums (NaN warmup prefix)."""
+    out = np.full(x.size, np.nan)
+    c = np.cumsum(x)
+    out[n - 1] = c[n - 1] / n
+    out[n:] = (c[n:] - c[:-n]) / n
+    return out
+
+
+try:
+    # JIT-compile the kernel when numba is available; pure NumPy otherwise.
+    from numba import njit
+    sma = njit(cache=True, fastmath=True)(sma)
+except ImportError:
+    pass
+
+
+def clean_and_feature_engineer(df, sma_period, window=180):
+    """Calculates the Simple Moving Average (SMA) over the trailing window.
+
+    Only window + SMA warmup rows are processed; typing and sorting
+    already happen at fetch time.
+    """
+    print("Starting feature engineering...")
+
+    df = df.iloc[-(window + sma_period - 1):].copy()
+    # Accumulate in float64 for the cumsum, store the result as float32
+    # like the price columns.
+    close = df['Close'].to_numpy(dtype=np.float64)
+    df[f'{sma_period}_day_SMA'] = sma(close, sma_period).astype(np.float32)
+
+    print("SMA calculated.")
+    return df.iloc[sma_period - 1:]
 
 #  VISUALIZATION
 
 def plot_stock_data(df, symbol, sma_period):
     """Creates a dual-axis chart for price, volume, and SMA."""
     print("Generating visualization...")
-    
-    fig, ax1 = plt.subplots(figsize=(14, 7))
+
+    fig = go.Figure()
 
     # --- Primary Y-axis (Closing Price and SMA) ---
-    color_price = 'tab:blue'
-    ax1.set_xlabel('Date')
-    ax1.set_ylabel('Closing Price ($)', color=color_price)
-    
-    ax1.plot(df.index, df['Close'], color=color_price, label='Closing Price', linewidth=1.5)
-    ax1.plot(df.index, df[f'{sma_period}_day_SMA'], color='red', 
-             label=f'{sma_period}-day SMA', linestyle='--', linewidth=2)
-    
-    ax1.tick_params(axis='y', labelcolor=color_price)
-    ax1.legend(loc='upper left')
-    ax1.grid(True, axis='y', linestyle=':', alpha=0.6)
-    
+    fig.add_trace(go.Scattergl(
+        x=df.index, y=df['Close'],
+        mode='lines', name='Closing Price'
+    ))
+    fig.add_trace(go.Scattergl(
+        x=df.index, y=df[f'{sma_period}_day_SMA'],
+        mode='lines', name=f'{sma_period}-day SMA',
+        line=dict(dash='dash')
+    ))
+
     # --- Secondary Y-axis (Trading Volume) ---
-    ax2 = ax1.twinx() 
-    color_volume = 'tab:gray'
-    ax2.set_ylabel('Trading Volume', color=color_volume)
-    
-    ax2.bar(df.index, df['Volume'], color=color_volume, alpha=0.3, label='Volume')
-    ax2.tick_params(axis='y', labelcolor=color_volume)
-    ax2.set_ylim(0, df['Volume'].max() * 4) # Scale volume for clarity
-    
+    fig.add_trace(go.Bar(
+        x=df.index, y=df['Volume'],
+        name='Volume', opacity=0.3, yaxis='y2'
+    ))
+
     # --- Final Styling ---
-    plt.title(f'Historical Price and Volume Analysis for {symbol} (Last 180 Days)')
-    fig.tight_layout()
-    plt.show()
+    fig.update_layout(
+        title=f'Historical Price and Volume Analysis for {symbol} (Last 180 Days)',
+        xaxis=dict(title='Date'),
+        yaxis=dict(title='Closing Price ($)', side='left'),
+        yaxis2=dict(title='Trading Volume', overlaying='y', side='right', showgrid=False),
+        legend=dict(x=0, y=1.1, orientation='h'),
+    )
+    fig.show()
     print("Visualization complete.")
 
 # MAIN EXECUTION BLOCK
@@ -108,12 +155,9 @@ if __name__ == "__main__":
     df_raw = fetch_stock_data(SYMBOL, API_KEY, OUTPUT_SIZE)
     
     if df_raw is not None and not df_raw.empty:
-        # 2. & 3. Clean, Prep, and Feature Engineer
-        df_processed = clean_and_feature_engineer(df_raw.copy(), SMA_PERIOD)
-        
-        # Filter to the last 180 trading days for a cleaner plot on the screen
-        df_recent = df_processed.tail(180) 
-        
+        # 2. & 3. Feature Engineer (trims to the last 180 trading days itself)
+        df_recent = clean_and_feature_engineer(df_raw, SMA_PERIOD)
+
         # 4. Visualization
         plot_stock_data(df_recent, SYMBOL, SMA_PERIOD)
         